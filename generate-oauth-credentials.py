@@ -13,9 +13,13 @@ import base64
 import secrets
 
 def generate_client_credentials(client_id="claude"):
-    """Generate a client ID and secret pair."""
-    client_secret = secrets.token_urlsafe(32)
-    return f"{client_id}:{client_secret}"
+    """
+    Generate a client ID and secret pair.
+    
+    Uses secrets.token_urlsafe, which draws all bytes in one call; prefer it
+    over building secrets character by character with secrets.choice.
+    """
+    return client_id, secrets.token_urlsafe(32)
 
 def generate_signing_key():
     """Generate a base64-encoded JWT signing key."""
@@ -28,11 +32,10 @@ def main():
     print()
     
     # Generate credentials
-    client_credentials = generate_client_credentials()
+    client_id, client_secret = generate_client_credentials()
+    client_credentials = f"{client_id}:{client_secret}"
     signing_key = generate_signing_key()
     
-    client_id, client_secret = client_credentials.split(":", 1)
-    
     print("✅ Generated OAuth2 Credentials")
     print()
     print("Add these to your .env file:")
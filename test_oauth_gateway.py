@@ -63,6 +63,56 @@ def test_token_generation():
         print(f"❌ Token generation failed: {e}")
         return False
 
+def test_gateway_token_verification():
+    """Test that the gateway's HS256 verifier never accepts a token PyJWT rejects."""
+    print("\nTesting gateway token verification...")
+    try:
+        import jwt
+        import secrets
+        import base64
+        
+        # The gateway reads its configuration at import
+        signing_key = secrets.token_bytes(32)
+        os.environ["MCP_OAUTH_SIGNING_KEY"] = base64.b64encode(signing_key).decode()
+        from ticktick_mcp import gateway
+        
+        token = gateway.create_access_token("test_client")
+        header, payload, sig = token.split(".")
+        alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+        # The last signature character carries two unused bits; changing them keeps the decoded bytes
+        spare_bits = alphabet[alphabet.index(sig[-1]) ^ 1]
+        tampered_payload = base64.urlsafe_b64encode(b'{"sub":"admin","exp":9999999999}').rstrip(b"=").decode()
+        
+        variants = {
+            "junk appended": token + "!!!!",
+            "junk around signature": f"{header}.{payload}.!{sig}!!!",
+            "newlines appended": token + "\n\n\n\n",
+            "padded signature": token + "=",
+            "double padded signature": token + "==",
+            "spare signature bits": f"{header}.{payload}.{sig[:-1]}{spare_bits}",
+            "tampered payload": f"{header}.{tampered_payload}.{sig}",
+        }
+        
+        def pyjwt_accepts(candidate):
+            try:
+                jwt.decode(candidate, signing_key, algorithms=["HS256"])
+                return True
+            except jwt.InvalidTokenError:
+                return False
+        
+        assert pyjwt_accepts(token), "PyJWT rejected a gateway-issued token"
+        assert gateway._verify_hs256(token)[0] == "test_client", "gateway rejected its own token"
+        for name, candidate in variants.items():
+            assert gateway._verify_hs256(candidate) is None, f"gateway accepted {name}"
+            # Stricter than PyJWT is fine (it tolerates one "=" pad); looser is not
+            assert not pyjwt_accepts(candidate) or name == "padded signature", f"PyJWT accepted {name}"
+        
+        print(f"✅ Gateway verifier rejects {len(variants)} tampered or non-canonical variants")
+        return True
+    except Exception as e:
+        print(f"❌ Gateway token verification failed: {e}")
+        return False
+
 def test_client_validation():
     """Test client credential validation logic."""
     print("\nTesting client credential validation...")
@@ -143,6 +193,7 @@ def main():
     # Only run other tests if imports work
     if results[0][1]:
         results.append(("Token Generation", test_token_generation()))
+        results.append(("Gateway Token Verification", test_gateway_token_verification()))
         results.append(("Client Validation", test_client_validation()))
     
     results.append(("Environment Config", test_env_config()))
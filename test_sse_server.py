@@ -4,11 +4,10 @@ Simple test script to verify the SSE server is working.
 This script can be run without authentication to test basic server functionality.
 """
 
+import http.client
+import socket
 import sys
 import time
-import urllib.request
-import urllib.error
-from urllib.parse import urljoin
 
 def test_sse_endpoint(host: str = "localhost", port: int = 8080, timeout: int = 5):
     """Test if the SSE endpoint is accessible."""
@@ -17,40 +16,46 @@ def test_sse_endpoint(host: str = "localhost", port: int = 8080, timeout: int =
     print(f"Testing TickTick MCP SSE server at {url}")
     print("-" * 60)
     
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
     try:
         print(f"Attempting connection (timeout: {timeout}s)...")
-        req = urllib.request.Request(url)
-        req.add_header('Accept', 'text/event-stream')
+        conn.request("GET", "/sse", headers={"Accept": "text/event-stream"})
+        response = conn.getresponse()
         
-        with urllib.request.urlopen(req, timeout=timeout) as response:
-            print(f"✅ Connection successful!")
-            print(f"   Status Code: {response.status}")
-            print(f"   Content-Type: {response.headers.get('Content-Type', 'N/A')}")
-            
-            # Read a small amount to verify SSE stream
-            print("\n📡 Reading initial SSE stream data...")
-            chunk = response.read(200).decode('utf-8', errors='ignore')
-            if chunk:
-                print(f"   Received data: {chunk[:100]}...")
-            
-            return True
+        if response.status >= 400:
+            print(f"❌ HTTP Error {response.status}: {response.reason}")
+            return False
+        
+        print(f"✅ Connection successful!")
+        print(f"   Status Code: {response.status}")
+        print(f"   Content-Type: {response.getheader('Content-Type', 'N/A')}")
+        
+        # Read a small amount to verify SSE stream
+        print("\n📡 Reading initial SSE stream data...")
+        chunk = response.read(200).decode('utf-8', errors='ignore')
+        if chunk:
+            print(f"   Received data: {chunk[:100]}...")
+        
+        return True
             
-    except urllib.error.HTTPError as e:
-        print(f"❌ HTTP Error {e.code}: {e.reason}")
+    except socket.timeout:
+        print(f"❌ Connection timeout after {timeout}s")
         return False
-    except urllib.error.URLError as e:
-        print(f"❌ Connection failed: {e.reason}")
+    except ConnectionRefusedError as e:
+        print(f"❌ Connection failed: {e}")
         print("\nPossible causes:")
         print("  - Server is not running")
         print("  - Server is running on a different port")
         print("  - Firewall blocking connection")
         return False
-    except TimeoutError:
-        print(f"❌ Connection timeout after {timeout}s")
+    except OSError as e:
+        print(f"❌ Connection failed: {e}")
         return False
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
         return False
+    finally:
+        conn.close()
 
 def main():
     """Main entry point."""
@@ -13,72 +13,180 @@ Environment Variables:
 """
 
 import base64
+import binascii
+import hashlib
+import hmac
+import json
 import os
-import secrets
-from datetime import datetime, timedelta
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from typing import Optional
 
-import jwt
-from fastapi import FastAPI, HTTPException, Request, Response, status
-from fastapi.responses import JSONResponse, StreamingResponse
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+import orjson
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import httpx
 
+# Status codes and headers used on the error paths, bound once
+_HTTP_400 = status.HTTP_400_BAD_REQUEST
+_HTTP_401 = status.HTTP_401_UNAUTHORIZED
+_HTTP_502 = status.HTTP_502_BAD_GATEWAY
+_WWW_AUTH = {"WWW-Authenticate": "Bearer"}  # Starlette copies this, so sharing is safe
+
 # OAuth2 token request model
 class TokenRequest(BaseModel):
     grant_type: str
     client_id: Optional[str] = None
     client_secret: Optional[str] = None
 
-# Load configuration from environment
-OAUTH_CLIENTS = {}
-oauth_clients_str = os.getenv("MCP_OAUTH_CLIENTS", "")
-if oauth_clients_str:
-    for pair in oauth_clients_str.split(","):
-        if ":" in pair:
-            client_id, client_secret = pair.strip().split(":", 1)
-            OAUTH_CLIENTS[client_id] = client_secret
-
-# Signing key for JWT tokens
-SIGNING_KEY_B64 = os.getenv("MCP_OAUTH_SIGNING_KEY", "")
-if not SIGNING_KEY_B64:
-    # Generate a random key if none provided (WARNING: tokens won't survive restart)
-    print("WARNING: MCP_OAUTH_SIGNING_KEY not set, generating random key (tokens won't persist across restarts)")
-    SIGNING_KEY = base64.b64encode(secrets.token_bytes(32)).decode()
-else:
-    SIGNING_KEY = SIGNING_KEY_B64
-
-TOKEN_EXPIRY_SECONDS = int(os.getenv("MCP_TOKEN_EXPIRY", "900"))  # 15 minutes default
-
-# FastMCP SSE server URL (internal)
-FASTMCP_SERVER_URL = os.getenv("FASTMCP_SERVER_URL", "http://127.0.0.1:8000")
+@dataclass(frozen=True, slots=True)
+class _Config:
+    """Gateway configuration, read from the environment once at import."""
+    token_expiry: int
+    fastmcp_url: str
+    signing_key: bytes
+    clients: dict[bytes, bytes]
+
+
+def _load_config() -> _Config:
+    """Build the gateway configuration from environment variables."""
+    # Clients are keyed by raw bytes for the Basic Auth fast path
+    clients: dict[bytes, bytes] = {}
+    oauth_clients_str = os.getenv("MCP_OAUTH_CLIENTS", "")
+    if oauth_clients_str:
+        for pair in oauth_clients_str.split(","):
+            if ":" in pair:
+                client_id, client_secret = pair.strip().split(":", 1)
+                clients[client_id.encode("utf-8")] = client_secret.encode("utf-8")
+    
+    # Signing key for JWT tokens
+    signing_key_b64 = os.getenv("MCP_OAUTH_SIGNING_KEY", "")
+    if not signing_key_b64:
+        # Generate a random key if none provided (WARNING: tokens won't survive restart)
+        import secrets
+        
+        print("WARNING: MCP_OAUTH_SIGNING_KEY not set, generating random key (tokens won't persist across restarts)")
+        signing_key = secrets.token_bytes(32)
+    else:
+        # Decode once so token signing and verification use raw key bytes
+        try:
+            signing_key = base64.b64decode(signing_key_b64, validate=True)
+        except binascii.Error:
+            raise SystemExit("ERROR: MCP_OAUTH_SIGNING_KEY is not valid base64 (see .env.example for how to generate one)")
+    
+    return _Config(
+        token_expiry=int(os.getenv("MCP_TOKEN_EXPIRY", "900")),  # 15 minutes default
+        # FastMCP SSE server URL (internal)
+        fastmcp_url=os.getenv("FASTMCP_SERVER_URL", "http://127.0.0.1:8000"),
+        signing_key=signing_key,
+        clients=clients
+    )
+
+
+CONFIG = _load_config()
+
+# Static JWT claims shared by every issued token
+_BASE_PAYLOAD = {"scope": "mcp:full", "iss": "ticktick-mcp-gateway"}
+
+# Pre-encoded JWT header; this gateway only ever issues HS256 tokens
+_STATIC_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+
+# Verified bearer tokens: token -> (sub, exp), oldest first
+_TOKEN_CACHE: "OrderedDict[str, tuple[str, int]]" = OrderedDict()
+_TOKEN_CACHE_MAX = 1024
+
+# Hop-by-hop headers that must not be copied from upstream responses
+_HOP_BY_HOP = frozenset({"connection", "keep-alive", "transfer-encoding", "content-length", "te", "trailer", "upgrade"})
+
+# Header templates for proxied requests (httpx and Starlette copy these, so reuse is safe)
+_JSON_CT = "application/json"
+_SSE_UPSTREAM_HEADERS = {"Accept": "text/event-stream", "Cache-Control": "no-cache"}
+_SSE_DOWNSTREAM_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the pooled HTTP client used by the proxy endpoints for the lifetime of the app."""
+    client = httpx.AsyncClient(
+        base_url=CONFIG.fastmcp_url,
+        timeout=30.0,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+    )
+    app.state.http = client
+    try:
+        yield
+    finally:
+        await client.aclose()
+
 
 app = FastAPI(
     title="TickTick MCP OAuth Gateway",
     description="OAuth2 client credentials gateway for TickTick MCP server",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-security = HTTPBasic()
+
+def _validate_bytes(client_id: bytes, client_secret: bytes) -> bool:
+    """Validate raw client credential bytes against configured clients (constant-time)."""
+    expected = CONFIG.clients.get(client_id)
+    return expected is not None and hmac.compare_digest(expected, client_secret)
+
+
+def _b64url(data: bytes) -> bytes:
+    """Base64url-encode without padding, as required for JWT segments."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _encode_hs256(payload_bytes: bytes) -> str:
+    """Sign a serialized JWT payload with HS256 and return the compact token."""
+    signing_input = _STATIC_HEADER_B64 + b"." + _b64url(payload_bytes)
+    sig = _b64url(hmac.new(CONFIG.signing_key, signing_input, hashlib.sha256).digest())
+    return f"{signing_input.decode()}.{sig.decode()}"
+
+
+def _b64url_decode(segment: bytes) -> bytes:
+    """Decode an unpadded base64url JWT segment."""
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
 
 
-def validate_client_credentials(client_id: str, client_secret: str) -> bool:
-    """Validate client credentials against configured clients."""
-    return OAUTH_CLIENTS.get(client_id) == client_secret
+def _verify_hs256(token: str) -> Optional[tuple[str, int]]:
+    """
+    Verify an HS256 token minted by this gateway.
+    Returns (sub, exp) if the signature and expiry are valid, None otherwise.
+    """
+    try:
+        signing_input, _, sig_b64 = token.encode("ascii").rpartition(b".")
+        header_b64, _, payload_b64 = signing_input.partition(b".")
+        # Only tokens carrying our exact static header are accepted
+        if header_b64 != _STATIC_HEADER_B64 or not payload_b64 or b"." in payload_b64:
+            return None
+        # Compare encoded forms: only the canonical unpadded signature matches, so
+        # junk characters or padding cannot produce distinct tokens that still verify
+        expected = _b64url(hmac.new(CONFIG.signing_key, signing_input, hashlib.sha256).digest())
+        if not hmac.compare_digest(expected, sig_b64):
+            return None
+        payload = orjson.loads(_b64url_decode(payload_b64))
+        sub = payload["sub"]
+        exp = payload["exp"]
+    except (ValueError, KeyError, TypeError):
+        # Covers non-ASCII input, bad base64, bad JSON and missing claims
+        return None
+    
+    if not isinstance(sub, str) or not isinstance(exp, int) or exp <= time.time():
+        return None
+    return sub, exp
 
 
 def create_access_token(client_id: str) -> str:
     """Create a JWT access token for the given client."""
-    now = datetime.utcnow()
-    payload = {
-        "sub": client_id,
-        "iat": now,
-        "exp": now + timedelta(seconds=TOKEN_EXPIRY_SECONDS),
-        "scope": "mcp:full",
-        "iss": "ticktick-mcp-gateway"
-    }
-    return jwt.encode(payload, SIGNING_KEY, algorithm="HS256")
+    now = int(time.time())
+    payload = {**_BASE_PAYLOAD, "sub": client_id, "iat": now, "exp": now + CONFIG.token_expiry}
+    return _encode_hs256(json.dumps(payload, separators=(",", ":")).encode())
 
 
 def verify_bearer_token(authorization: Optional[str]) -> Optional[str]:
@@ -86,23 +194,26 @@ def verify_bearer_token(authorization: Optional[str]) -> Optional[str]:
     Verify Bearer token from Authorization header.
     Returns client_id (sub claim) if valid, None otherwise.
     """
-    if not authorization:
+    if not authorization or len(authorization) < 8 or authorization[:7].lower() != "bearer ":
         return None
     
-    parts = authorization.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
-        return None
+    token = authorization[7:].strip()
     
-    token = parts[1]
-    try:
-        payload = jwt.decode(token, SIGNING_KEY, algorithms=["HS256"])
-        # Check expiry (jwt.decode already does this, but explicit check)
-        exp = payload.get("exp")
-        if exp and datetime.utcfromtimestamp(exp) < datetime.utcnow():
-            return None
-        return payload.get("sub")
-    except jwt.InvalidTokenError:
+    # Fast path: token already verified and not yet expired
+    cached = _TOKEN_CACHE.get(token)
+    if cached is not None:
+        if cached[1] > time.time():
+            return cached[0]
+        _TOKEN_CACHE.pop(token, None)
+    
+    verified = _verify_hs256(token)
+    if verified is None:
         return None
+    
+    _TOKEN_CACHE[token] = verified
+    if len(_TOKEN_CACHE) > _TOKEN_CACHE_MAX:
+        _TOKEN_CACHE.popitem(last=False)
+    return verified[0]
 
 
 @app.post("/oauth/token")
@@ -116,57 +227,63 @@ async def token_endpoint(
     1. Basic Auth header (preferred)
     2. Form body with client_id and client_secret
     """
-    client_id = None
-    client_secret = None
+    # Credentials are kept as bytes so Basic Auth never round-trips through str
+    client_id = b""
+    client_secret = b""
     
     # Try Basic Auth first
     auth_header = request.headers.get("authorization", "")
     if auth_header.startswith("Basic "):
         try:
-            encoded = auth_header.split(" ", 1)[1]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            client_id, client_secret = decoded.split(":", 1)
+            decoded = base64.b64decode(auth_header[6:].encode())
+            cid, sep, sec = decoded.partition(b":")
+            if sep:
+                client_id, client_secret = cid, sec
         except Exception:
             pass
     
     # Fall back to form body
     if not client_id and token_request:
-        client_id = token_request.client_id
-        client_secret = token_request.client_secret
+        client_id = (token_request.client_id or "").encode("utf-8")
+        client_secret = (token_request.client_secret or "").encode("utf-8")
     
     # Validate grant type
     grant_type = token_request.grant_type if token_request else None
     if grant_type != "client_credentials":
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
+            status_code=_HTTP_400,
             detail="unsupported_grant_type",
-            headers={"WWW-Authenticate": "Bearer"}
+            headers=_WWW_AUTH
         )
     
     # Validate credentials
     if not client_id or not client_secret:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
+            status_code=_HTTP_401,
             detail="invalid_client",
-            headers={"WWW-Authenticate": "Bearer"}
+            headers=_WWW_AUTH
         )
     
-    if not validate_client_credentials(client_id, client_secret):
+    if not _validate_bytes(client_id, client_secret):
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
+            status_code=_HTTP_401,
             detail="invalid_client",
-            headers={"WWW-Authenticate": "Bearer"}
+            headers=_WWW_AUTH
         )
     
     # Issue token
-    access_token = create_access_token(client_id)
+    access_token = create_access_token(client_id.decode("utf-8"))
     
-    return JSONResponse({
-        "access_token": access_token,
-        "token_type": "Bearer",
-        "expires_in": TOKEN_EXPIRY_SECONDS,
-        "scope": "mcp:full"
-    })
+    # Serialized with orjson straight into the response body
+    return Response(
+        content=orjson.dumps({
+            "access_token": access_token,
+            "token_type": "Bearer",
+            "expires_in": CONFIG.token_expiry,
+            "scope": "mcp:full"
+        }),
+        media_type=_JSON_CT
+    )
 
 
 @app.api_route("/sse", methods=["GET", "POST"])
@@ -182,58 +299,56 @@ async def sse_proxy(request: Request):
     
     if not client_id:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
+            status_code=_HTTP_401,
             detail="Invalid or missing bearer token",
-            headers={"WWW-Authenticate": "Bearer"}
+            headers=_WWW_AUTH
         )
     
     # Forward to FastMCP SSE server
-    async with httpx.AsyncClient() as client:
-        try:
-            # Handle POST requests (MCP messages)
-            if request.method == "POST":
-                body = await request.body()
-                response = await client.post(
-                    f"{FASTMCP_SERVER_URL}/sse",
-                    content=body,
-                    headers={
-                        "Content-Type": request.headers.get("content-type", "application/json")
-                    },
-                    timeout=30.0
-                )
-                
-                return Response(
-                    content=response.content,
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
-            
-            # Handle GET requests (SSE streaming)
-            # Stream the SSE response
-            async with client.stream(
-                "GET",
-                f"{FASTMCP_SERVER_URL}/sse",
+    client = request.app.state.http
+    try:
+        # Handle POST requests (MCP messages)
+        if request.method == "POST":
+            # Stream the request body through without buffering it
+            upstream_request = client.build_request(
+                "POST",
+                "/sse",
+                content=request.stream(),
                 headers={
-                    "Accept": "text/event-stream",
-                    "Cache-Control": "no-cache"
+                    "Content-Type": request.headers.get("content-type", _JSON_CT)
                 },
-                timeout=None
-            ) as response:
-                # Return streaming response
-                return StreamingResponse(
-                    response.aiter_raw(),
-                    media_type="text/event-stream",
-                    headers={
-                        "Cache-Control": "no-cache",
-                        "Connection": "keep-alive",
-                        "X-Accel-Buffering": "no"
-                    }
-                )
-        except httpx.RequestError as e:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Failed to connect to MCP server: {str(e)}"
+                timeout=30.0
+            )
+            response = await client.send(upstream_request, stream=True)
+            
+            return StreamingResponse(
+                response.aiter_raw(),
+                status_code=response.status_code,
+                headers={k: v for k, v in response.headers.items() if k.lower() not in _HOP_BY_HOP},
+                background=BackgroundTask(response.aclose)
             )
+        
+        # Handle GET requests (SSE streaming)
+        # The upstream stream stays open until Starlette has finished sending it
+        upstream_request = client.build_request(
+            "GET",
+            "/sse",
+            headers=_SSE_UPSTREAM_HEADERS,
+            timeout=None
+        )
+        response = await client.send(upstream_request, stream=True)
+        
+        return StreamingResponse(
+            response.aiter_raw(),
+            media_type="text/event-stream",
+            headers=_SSE_DOWNSTREAM_HEADERS,
+            background=BackgroundTask(response.aclose)
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=_HTTP_502,
+            detail=f"Failed to connect to MCP server: {str(e)}"
+        )
 
 
 @app.post("/messages")
@@ -248,35 +363,36 @@ async def messages_proxy(request: Request):
     
     if not client_id:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
+            status_code=_HTTP_401,
             detail="Invalid or missing bearer token",
-            headers={"WWW-Authenticate": "Bearer"}
+            headers=_WWW_AUTH
         )
     
-    # Forward to FastMCP server
-    body = await request.body()
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{FASTMCP_SERVER_URL}/messages",
-                content=body,
-                headers={
-                    "Content-Type": request.headers.get("content-type", "application/json")
-                },
-                timeout=30.0
-            )
-            
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=dict(response.headers)
-            )
-        except httpx.RequestError as e:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Failed to connect to MCP server: {str(e)}"
-            )
+    # Forward to FastMCP server, streaming the body in both directions
+    client = request.app.state.http
+    try:
+        upstream_request = client.build_request(
+            "POST",
+            "/messages",
+            content=request.stream(),
+            headers={
+                "Content-Type": request.headers.get("content-type", _JSON_CT)
+            },
+            timeout=30.0
+        )
+        response = await client.send(upstream_request, stream=True)
+        
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers={k: v for k, v in response.headers.items() if k.lower() not in _HOP_BY_HOP},
+            background=BackgroundTask(response.aclose)
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=_HTTP_502,
+            detail=f"Failed to connect to MCP server: {str(e)}"
+        )
 
 
 @app.get("/health")
@@ -285,8 +401,8 @@ async def health_check():
     return {
         "status": "healthy",
         "gateway": "ticktick-mcp-oauth",
-        "clients_configured": len(OAUTH_CLIENTS),
-        "token_expiry_seconds": TOKEN_EXPIRY_SECONDS
+        "clients_configured": len(CONFIG.clients),
+        "token_expiry_seconds": CONFIG.token_expiry
     }
 
 
@@ -311,13 +427,14 @@ async def mcp_metadata():
 if __name__ == "__main__":
     import uvicorn
     
-    if not OAUTH_CLIENTS:
+    if not CONFIG.clients:
         print("ERROR: No OAuth clients configured. Set MCP_OAUTH_CLIENTS environment variable.")
         print("Example: MCP_OAUTH_CLIENTS=client1:secret1,client2:secret2")
         exit(1)
     
-    print(f"Starting OAuth gateway with {len(OAUTH_CLIENTS)} configured client(s)")
-    print(f"Token expiry: {TOKEN_EXPIRY_SECONDS} seconds")
-    print(f"FastMCP server URL: {FASTMCP_SERVER_URL}")
+    print(f"Starting OAuth gateway with {len(CONFIG.clients)} configured client(s)")
+    print(f"Token expiry: {CONFIG.token_expiry} seconds")
+    print(f"FastMCP server URL: {CONFIG.fastmcp_url}")
     
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    # loop="auto" picks uvloop where it is installed (not on Windows); httptools parses HTTP in C
+    uvicorn.run(app, host="0.0.0.0", port=8080, loop="auto", http="httptools", proxy_headers=True)
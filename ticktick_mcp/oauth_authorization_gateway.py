@@ -6,28 +6,146 @@ This gateway implements:
 2. Token endpoint for exchanging authorization codes
 3. Token refresh
 4. SSE/messages proxying with Bearer token validation
+
+MCP_OAUTH_SIGNING_KEY is a base64-encoded key, decoded to raw bytes for HS256
+signing the same way as in gateway.py.
 """
 
+import asyncio
 import base64
+import binascii
+import hashlib
+import heapq
+import hmac
 import os
 import secrets
+import time
 import uuid
 import logging
-from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Optional, Dict
-from urllib.parse import urlencode, parse_qs
+from urllib.parse import urlencode, parse_qsl
 
 import jwt
+import orjson
 from fastapi import FastAPI, HTTPException, Request, Response, status
-from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, HTMLResponse
-from html import escape
-from pydantic import BaseModel
+from fastapi.responses import RedirectResponse, StreamingResponse, HTMLResponse
+from pydantic import BaseModel, ValidationError
+from starlette.background import BackgroundTask
 import httpx
 
-# In-memory stores (use Redis or DB in production)
-authorization_codes: Dict[str, dict] = {}
-access_tokens: Dict[str, dict] = {}
-refresh_tokens: Dict[str, dict] = {}
+# Bound once for the PKCE hot path
+_SHA256 = hashlib.sha256
+
+
+class ExpiringStore:
+    """
+    In-memory dict whose entries expire at their "expires_at" epoch time.
+    A min-heap of (expires_at, key) lets reap() drop expired entries without a full sweep.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, dict] = {}
+        self._heap: list = []
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def set(self, key: str, value: dict) -> None:
+        """Store value until value["expires_at"] (epoch seconds)."""
+        self._data[key] = value
+        heapq.heappush(self._heap, (value["expires_at"], key))
+
+    def _get(self, key: str, now: Optional[float]) -> Optional[dict]:
+        value = self._data.get(key)
+        if value is None:
+            return None
+        if value["expires_at"] <= (time.time() if now is None else now):
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str, now: Optional[float] = None) -> Optional[dict]:
+        """Return the entry for key, or None if it is missing or expired."""
+        return self._get(key, now)
+
+    async def pop(self, key: str, now: Optional[float] = None) -> Optional[dict]:
+        """Remove and return the entry for key, or None if it is missing or expired."""
+        value = self._get(key, now)
+        if value is not None:
+            del self._data[key]
+        return value
+
+    async def count(self) -> Optional[int]:
+        """Number of live entries."""
+        return len(self._data)
+
+    def next_expiry(self) -> Optional[float]:
+        """Earliest pending expiry time, if any."""
+        return self._heap[0][0] if self._heap else None
+
+    def reap(self, now: float) -> None:
+        """Drop every entry that expired at or before now."""
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            value = self._data.get(key)
+            # Skip heap entries for keys that were removed or re-set with a later expiry
+            if value is not None and value["expires_at"] <= now:
+                del self._data[key]
+
+
+class RedisStore:
+    """
+    Redis-backed store with the same async interface as ExpiringStore.
+    Entries are orjson-encoded and expire through Redis TTLs, so state is shared across workers.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.client = None  # redis.asyncio.Redis, bound in lifespan
+
+    async def set(self, key: str, value: dict) -> None:
+        """Store value until value["expires_at"] (epoch seconds)."""
+        await self.client.set(self.prefix + key, orjson.dumps(value), pxat=int(value["expires_at"] * 1000))
+
+    async def get(self, key: str, now: Optional[float] = None) -> Optional[dict]:
+        """Return the entry for key, or None if it is missing or expired."""
+        raw = await self.client.get(self.prefix + key)
+        return orjson.loads(raw) if raw is not None else None
+
+    async def pop(self, key: str, now: Optional[float] = None) -> Optional[dict]:
+        """Atomically remove and return the entry for key (GETDEL, Redis >= 6.2)."""
+        raw = await self.client.getdel(self.prefix + key)
+        return orjson.loads(raw) if raw is not None else None
+
+    async def count(self) -> Optional[int]:
+        """Not tracked for Redis; counting would need a keyspace scan."""
+        return None
+
+# Upstream response headers worth forwarding; hop-by-hop and framing headers are left to Starlette
+_FORWARD_HEADERS = frozenset({"content-type", "cache-control", "etag"})
+
+# SSE streams may idle indefinitely between events, but connect/write/pool keep deadlines
+_SSE_TIMEOUT = httpx.Timeout(30.0, connect=5.0, read=None)
+
+# Largest request body the proxy will forward upstream
+_MAX_BODY_BYTES = 1024 * 1024  # 1 MiB
+
+# Upper bound on how long the reaper sleeps, so newly added short-lived entries are still reaped promptly
+_REAPER_MAX_SLEEP = 60.0
+
+# Short-lived cache of verified bearer tokens: blake2b(token) -> (user_id, valid_until epoch)
+_VERIFY_CACHE_TTL = 5.0
+_VERIFY_CACHE_MAX = 10_000
+_verify_cache: "OrderedDict[bytes, tuple[str, float]]" = OrderedDict()
+
+# Issued JWTs are well over 40 characters; anything outside these bounds is not ours
+_AUTH_HEADER_MIN_LEN = 40
+_AUTH_HEADER_MAX_LEN = 4096
+_BEARER_PREFIXES = ("Bearer ", "bearer ", "BEARER ")
 
 # OAuth2 models
 class TokenRequest(BaseModel):
@@ -51,26 +169,126 @@ if oauth_clients_str:
 SIGNING_KEY_B64 = os.getenv("MCP_OAUTH_SIGNING_KEY", "")
 if not SIGNING_KEY_B64:
     print("WARNING: MCP_OAUTH_SIGNING_KEY not set, generating random key")
-    SIGNING_KEY = base64.b64encode(secrets.token_bytes(32)).decode()
+    SIGNING_KEY_BYTES = secrets.token_bytes(32)
 else:
-    SIGNING_KEY = SIGNING_KEY_B64
+    # Decoded once to raw key bytes, exactly as the client credentials gateway does
+    try:
+        SIGNING_KEY_BYTES = base64.b64decode(SIGNING_KEY_B64, validate=True)
+    except binascii.Error:
+        raise SystemExit("ERROR: MCP_OAUTH_SIGNING_KEY is not valid base64 (see .env.example for how to generate one)")
+
+# Pre-bound JWT codec and decode arguments, reused on every call
+_JWT = jwt.PyJWT()
+_JWT_ALGORITHMS = ("HS256",)
+_JWT_OPTS = {"require": ["exp", "sub"], "verify_exp": True}
 
 TOKEN_EXPIRY_SECONDS = int(os.getenv("MCP_TOKEN_EXPIRY", "3600"))  # 1 hour
 REFRESH_TOKEN_EXPIRY_SECONDS = int(os.getenv("MCP_REFRESH_TOKEN_EXPIRY", "2592000"))  # 30 days
 FASTMCP_SERVER_URL = os.getenv("FASTMCP_SERVER_URL", "http://127.0.0.1:8000")
+REDIS_URL = os.getenv("MCP_OAUTH_REDIS_URL", "")
+
+# Authorization code / refresh token stores. In-memory by default; set
+# MCP_OAUTH_REDIS_URL to share them across workers and restarts.
+# Access tokens are self-contained JWTs, so they are not stored.
+if REDIS_URL:
+    authorization_codes = RedisStore("authz:")
+    refresh_tokens = RedisStore("refresh:")
+else:
+    authorization_codes = ExpiringStore()
+    refresh_tokens = ExpiringStore()
 
 # Claude.ai callback URL
 CLAUDE_CALLBACK_URL = "https://claude.ai/api/mcp/auth_callback"
 
+# Redirect page served by /authorize. Provides both auto-redirect and a manual link
+# to satisfy browser or app-specific flows.
+_AUTHORIZE_TEMPLATE = """
+    <!DOCTYPE html>
+    <html lang=\"en\">
+    <head>
+        <meta charset=\"utf-8\">
+        <meta http-equiv=\"refresh\" content=\"0;url={url}\">
+        <title>Redirecting...</title>
+        <style>
+            body {{ font-family: system-ui, sans-serif; text-align: center; padding-top: 4rem; color: #0f172a; }}
+            a {{ color: #2563eb; text-decoration: none; font-size: 1.1rem; }}
+        </style>
+    </head>
+    <body>
+        <p>Completing TickTick MCP authorization...</p>
+        <p>If you are not redirected automatically, <a href=\"{url}\">click here to continue</a>.</p>
+    </body>
+    </html>
+    """
+
+
+async def _reaper():
+    """Evict expired authorization codes and refresh tokens in the background."""
+    stores = (authorization_codes, refresh_tokens)
+    while True:
+        now = time.time()
+        for store in stores:
+            store.reap(now)
+        pending = [expiry for expiry in (store.next_expiry() for store in stores) if expiry is not None]
+        delay = min(pending) - now if pending else _REAPER_MAX_SLEEP
+        await asyncio.sleep(min(max(delay, 0.0), _REAPER_MAX_SLEEP))
+
+
+def _json_response(content: dict, status_code: int = 200) -> Response:
+    """JSON response serialized with orjson."""
+    return Response(content=orjson.dumps(content), status_code=status_code, media_type="application/json")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the pooled HTTP client to FastMCP and the token store backend for the lifetime of the app."""
+    client = httpx.AsyncClient(
+        base_url=FASTMCP_SERVER_URL,
+        limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=30.0),
+        timeout=httpx.Timeout(30.0, connect=5.0)
+    )
+    app.state.http = client
+    
+    redis_client = None
+    reaper = None
+    if REDIS_URL:
+        # Redis expires entries itself, so no reaper is needed
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as exc:
+            raise RuntimeError('MCP_OAUTH_REDIS_URL is set but the optional redis package is not installed (pip install "redis>=5.0.1,<6.0.0")') from exc
+        
+        redis_client = aioredis.from_url(REDIS_URL)
+        authorization_codes.client = redis_client
+        refresh_tokens.client = redis_client
+    else:
+        reaper = asyncio.create_task(_reaper())
+    try:
+        yield
+    finally:
+        if reaper is not None:
+            reaper.cancel()
+            try:
+                await reaper
+            except asyncio.CancelledError:
+                pass
+        if redis_client is not None:
+            await redis_client.aclose()
+        await client.aclose()
+
+
 app = FastAPI(
     title="TickTick MCP OAuth Authorization Gateway",
     description="OAuth2 Authorization Code flow for Claude.ai",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Logging setup
 LOG_LEVEL = os.getenv("MCP_OAUTH_LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO))
+# Unknown level names fall back to INFO instead of failing at startup
+LOG_LEVEL_NO = getattr(logging, LOG_LEVEL, logging.INFO)
+logging.basicConfig(level=LOG_LEVEL_NO)
 logger = logging.getLogger("oauth_gateway")
 DISABLE_PKCE = os.getenv("MCP_OAUTH_DISABLE_PKCE", "0") in ("1", "true", "TRUE")
 
@@ -104,52 +322,66 @@ async def root_post_probe():
 
 
 
-def create_access_token(user_id: str) -> str:
-    """Create a JWT access token."""
-    now = datetime.now(timezone.utc)
+def create_access_token(user_id: str, scope: str = "mcp:full", now: Optional[float] = None) -> str:
+    """Create a JWT access token; now is the caller's epoch timestamp, if it already has one."""
+    if now is None:
+        now = time.time()
+    exp_ts = now + TOKEN_EXPIRY_SECONDS
     payload = {
         "sub": user_id,
-        "iat": now,
-        "exp": now + timedelta(seconds=TOKEN_EXPIRY_SECONDS),
-        "scope": "mcp:full",
+        "iat": datetime.fromtimestamp(now, timezone.utc),
+        "exp": datetime.fromtimestamp(exp_ts, timezone.utc),
+        "scope": scope,
         "iss": "ticktick-mcp-gateway"
     }
-    return jwt.encode(payload, SIGNING_KEY, algorithm="HS256")
+    return _JWT.encode(payload, SIGNING_KEY_BYTES, algorithm="HS256")
 
 
 def verify_bearer_token(authorization: Optional[str]) -> Optional[str]:
     """Verify Bearer token from Authorization header."""
+    # Every rejection logs at DEBUG only, so unauthenticated and scanner traffic cannot flood the logs
     if not authorization:
-        logger.warning("verify_bearer_token: missing Authorization header")
+        logger.debug("verify_bearer_token: missing Authorization header")
         return None
     
-    parts = authorization.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
-        logger.warning("verify_bearer_token: malformed Authorization header")
+    # Cheap rejections for scanner junk before any hashing or decoding
+    if not _AUTH_HEADER_MIN_LEN <= len(authorization) <= _AUTH_HEADER_MAX_LEN:
+        logger.debug("verify_bearer_token: Authorization header length %d out of range", len(authorization))
         return None
     
-    token = parts[1]
-    token_prefix = token[:8]
-    logger.debug("verify_bearer_token: received token prefix %s", token_prefix)
+    # Single C-level prefix comparison; no slice or lower() allocation
+    if not authorization.startswith(_BEARER_PREFIXES):
+        logger.debug("verify_bearer_token: malformed Authorization header")
+        return None
     
-    # Check in-memory store first
-    if token in access_tokens:
-        token_data = access_tokens[token]
-        if token_data["expires_at"] > datetime.now(timezone.utc):
-            return token_data["user_id"]
-        else:
-            # Token expired
-            del access_tokens[token]
-            logger.warning("verify_bearer_token: token prefix %s expired", token_prefix)
-            return None
+    token = authorization[7:]
+    if not token.isascii():
+        logger.debug("verify_bearer_token: non-ASCII bearer token")
+        return None
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("verify_bearer_token: received token prefix %s", token[:8])
+    
+    # Check the verification cache first (keyed by hash, never the raw token)
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+    cached = _verify_cache.get(cache_key)
+    if cached is not None:
+        if cached[1] > now:
+            return cached[0]
+        del _verify_cache[cache_key]
     
-    # Fall back to JWT validation
+    # Single verified decode; pyjwt enforces exp and the required claims
     try:
-        payload = jwt.decode(token, SIGNING_KEY, algorithms=["HS256"])
-        return payload.get("sub")
+        payload = _JWT.decode(token, SIGNING_KEY_BYTES, algorithms=_JWT_ALGORITHMS, options=_JWT_OPTS)
     except jwt.InvalidTokenError:
-        logger.warning("verify_bearer_token: token prefix %s failed JWT validation", token_prefix)
+        logger.debug("verify_bearer_token: token prefix %s failed JWT validation", token[:8])
         return None
+    
+    user_id = payload["sub"]
+    _verify_cache[cache_key] = (user_id, min(payload["exp"], now + _VERIFY_CACHE_TTL))
+    if len(_verify_cache) > _VERIFY_CACHE_MAX:
+        _verify_cache.popitem(last=False)
+    return user_id
 
 
 @app.get("/authorize")
@@ -167,16 +399,18 @@ async def authorize(
     For demo purposes, this automatically approves and redirects.
     In production, this would show a consent screen.
     """
+    now = time.time()
+    
     # Validate parameters
     if response_type != "code":
-        return JSONResponse(
+        return _json_response(
             {"error": "unsupported_response_type"},
             status_code=status.HTTP_400_BAD_REQUEST
         )
     
     # For Claude.ai, validate redirect_uri
     if redirect_uri != CLAUDE_CALLBACK_URL:
-        return JSONResponse(
+        return _json_response(
             {"error": "invalid_redirect_uri", "detail": f"Expected {CLAUDE_CALLBACK_URL}"},
             status_code=status.HTTP_400_BAD_REQUEST
         )
@@ -185,15 +419,16 @@ async def authorize(
     auth_code = secrets.token_urlsafe(32)
     
     # Store authorization code with associated data
-    authorization_codes[auth_code] = {
+    await authorization_codes.set(auth_code, {
         "client_id": client_id,
         "redirect_uri": redirect_uri,
         "scope": scope or "mcp:full",
-        "code_challenge": code_challenge,
+        # RFC 7636 challenges are unpadded; normalize once so the token endpoint does a single compare
+        "code_challenge": code_challenge.rstrip("=") if code_challenge else code_challenge,
         "code_challenge_method": code_challenge_method,
-        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=10),
+        "expires_at": now + 600.0,  # 10 minutes
         "user_id": f"user_{uuid.uuid4().hex[:8]}"  # Demo user ID
-    }
+    })
     
     # Redirect back to Claude with authorization code
     params = {
@@ -202,111 +437,93 @@ async def authorize(
     }
     
     redirect_url = f"{redirect_uri}?{urlencode(params)}"
-    safe_redirect_url = escape(redirect_url, quote=True)
-    # Provide both auto-redirect and manual link to satisfy browser or app-specific flows.
-    html = f"""
-    <!DOCTYPE html>
-    <html lang=\"en\">
-    <head>
-        <meta charset=\"utf-8\">
-        <meta http-equiv=\"refresh\" content=\"0;url={safe_redirect_url}\">
-        <title>Redirecting...</title>
-        <style>
-            body {{ font-family: system-ui, sans-serif; text-align: center; padding-top: 4rem; color: #0f172a; }}
-            a {{ color: #2563eb; text-decoration: none; font-size: 1.1rem; }}
-        </style>
-    </head>
-    <body>
-        <p>Completing TickTick MCP authorization...</p>
-        <p>If you are not redirected automatically, <a href=\"{safe_redirect_url}\">click here to continue</a>.</p>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html, status_code=status.HTTP_200_OK)
+    # redirect_uri is the fixed callback and urlencode percent-escapes code/state,
+    # so only "&" needs escaping for the HTML attribute context.
+    safe_redirect_url = redirect_url.replace("&", "&amp;")
+    return HTMLResponse(content=_AUTHORIZE_TEMPLATE.format(url=safe_redirect_url), status_code=status.HTTP_200_OK)
 
 
 @app.post("/oauth/token")
 async def token_endpoint(request: Request):
     """Unified OAuth2 token endpoint supporting JSON and form-encoded bodies with detailed logging."""
+    now = time.time()
     content_type = request.headers.get("content-type", "")
-    data: Dict[str, str] = {}
-
-    if "application/x-www-form-urlencoded" in content_type:
-        body = (await request.body()).decode()
-        import urllib.parse
-        parsed = urllib.parse.parse_qs(body)
-        # parse_qs always returns list values; flatten to first item or empty string
-        data = {k: (v[0] if v else "") for k, v in parsed.items()}
-    else:
-        try:
-            data = await request.json()
-        except Exception:
-            data = {}
+    body = await request.body()
+
+    try:
+        if "application/x-www-form-urlencoded" in content_type:
+            # Urlencoded bodies are ASCII; latin-1 decoding is a cheap, lossless byte->str step
+            form = TokenRequest.model_validate(dict(parse_qsl(body.decode("latin-1"), keep_blank_values=True)))
+        else:
+            form = TokenRequest.model_validate_json(body or b"{}")
+    except ValidationError as exc:
+        missing_grant = any(err["loc"] == ("grant_type",) for err in exc.errors())
+        logger.info("/oauth/token rejected body (%s)", "missing grant_type" if missing_grant else "invalid")
+        return _json_response(
+            {"error": "invalid_request", "detail": "missing_grant_type" if missing_grant else "invalid_request_body"},
+            status_code=400
+        )
 
-    grant_type = data.get("grant_type")
-    logger.info(f"/oauth/token grant_type={grant_type}")
+    grant_type = form.grant_type
+    logger.info("/oauth/token grant_type=%s", grant_type)
     if not grant_type:
-        return JSONResponse({"error": "invalid_request", "detail": "missing_grant_type"}, status_code=400)
+        return _json_response({"error": "invalid_request", "detail": "missing_grant_type"}, status_code=400)
 
     if grant_type == "authorization_code":
-        code = data.get("code")
-        redirect_uri = data.get("redirect_uri")
-        code_verifier = data.get("code_verifier")
-        logger.info(f"authorization_code flow code_present={'yes' if code else 'no'} redirect_uri={redirect_uri}")
-
-        if not code or code not in authorization_codes:
-            logger.warning("authorization_code not found or missing")
-            return JSONResponse({"error": "invalid_grant", "reason": "code_not_found"}, status_code=400)
-
-        auth_data = authorization_codes[code]
-        logger.info(f"auth_data stored redirect_uri={auth_data['redirect_uri']} expires_at={auth_data['expires_at'].isoformat()} scope={auth_data['scope']} pkce={'yes' if auth_data.get('code_challenge') else 'no'}")
+        code = form.code
+        redirect_uri = form.redirect_uri
+        code_verifier = form.code_verifier
+        logger.info("authorization_code flow code_present=%s redirect_uri=%s", "yes" if code else "no", redirect_uri)
+
+        # Consume the code up front so it is single-use even under concurrent redemption.
+        # A failed redirect_uri or PKCE check below therefore burns the code too; the
+        # client has to restart the authorization flow, as RFC 6749 section 4.1.2 intends.
+        auth_data = await authorization_codes.pop(code, now) if code else None
+        if auth_data is None:
+            logger.warning("authorization_code not found, missing or expired")
+            return _json_response({"error": "invalid_grant", "reason": "code_not_found"}, status_code=400)
+
+        logger.info(
+            "auth_data stored redirect_uri=%s scope=%s pkce=%s",
+            auth_data["redirect_uri"], auth_data["scope"], "yes" if auth_data.get("code_challenge") else "no"
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "auth_data expires_at=%s",
+                datetime.fromtimestamp(auth_data["expires_at"], timezone.utc).isoformat()
+            )
 
         if redirect_uri and redirect_uri != auth_data["redirect_uri"]:
             logger.warning("redirect_uri mismatch")
-            return JSONResponse({"error": "invalid_grant", "reason": "redirect_uri_mismatch"}, status_code=400)
-
-        now = datetime.now(timezone.utc)
-        if auth_data["expires_at"] < now:
-            del authorization_codes[code]
-            logger.warning("authorization_code expired")
-            return JSONResponse({"error": "invalid_grant", "reason": "code_expired"}, status_code=400)
+            return _json_response({"error": "invalid_grant", "reason": "redirect_uri_mismatch"}, status_code=400)
 
         # PKCE verification
         if auth_data.get("code_challenge") and not DISABLE_PKCE:
             if not code_verifier:
                 logger.warning("code_verifier missing while PKCE required")
-                return JSONResponse({"error": "invalid_grant", "reason": "code_verifier_required"}, status_code=400)
-            import hashlib
-            sha = hashlib.sha256(code_verifier.encode()).digest()
-            padded = base64.urlsafe_b64encode(sha).decode()
-            unpadded = padded.rstrip("=")
-            stored = auth_data["code_challenge"]
-            pkce_match = stored in (padded, unpadded)
-            logger.info(f"PKCE verify stored={stored} computed_unpadded={unpadded} computed_padded={padded} match={pkce_match}")
+                return _json_response({"error": "invalid_grant", "reason": "code_verifier_required"}, status_code=400)
+            digest = _SHA256(code_verifier.encode()).digest()
+            computed = base64.urlsafe_b64encode(digest).rstrip(b"=")
+            pkce_match = hmac.compare_digest(computed, auth_data["code_challenge"].encode())
             if not pkce_match:
-                return JSONResponse({"error": "invalid_grant", "reason": "pkce_mismatch"}, status_code=400)
+                logger.warning("PKCE verification failed")
+                return _json_response({"error": "invalid_grant", "reason": "pkce_mismatch"}, status_code=400)
         elif auth_data.get("code_challenge") and DISABLE_PKCE:
             logger.info("PKCE disabled via env MCP_OAUTH_DISABLE_PKCE; skipping verification")
 
         user_id = auth_data["user_id"]
-        access_token = secrets.token_urlsafe(32)
+        access_token = create_access_token(user_id, auth_data["scope"], now)
         refresh_token = secrets.token_urlsafe(32)
 
-        access_tokens[access_token] = {
-            "user_id": user_id,
-            "scope": auth_data["scope"],
-            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=TOKEN_EXPIRY_SECONDS)
-        }
-        refresh_tokens[refresh_token] = {
+        await refresh_tokens.set(refresh_token, {
             "user_id": user_id,
             "scope": auth_data["scope"],
-            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=REFRESH_TOKEN_EXPIRY_SECONDS)
-        }
+            "expires_at": now + REFRESH_TOKEN_EXPIRY_SECONDS
+        })
 
-        del authorization_codes[code]
         logger.info("authorization_code exchanged successfully; tokens issued")
 
-        return JSONResponse({
+        return _json_response({
             "access_token": access_token,
             "token_type": "Bearer",
             "expires_in": TOKEN_EXPIRY_SECONDS,
@@ -315,27 +532,17 @@ async def token_endpoint(request: Request):
         })
 
     elif grant_type == "refresh_token":
-        refresh_token = data.get("refresh_token")
+        refresh_token = form.refresh_token
         logger.info("refresh_token flow started")
-        if not refresh_token or refresh_token not in refresh_tokens:
-            logger.warning("refresh_token not found")
-            return JSONResponse({"error": "invalid_grant", "reason": "refresh_token_not_found"}, status_code=400)
-
-        refresh_data = refresh_tokens[refresh_token]
-        if refresh_data["expires_at"] < datetime.now(timezone.utc):
-            del refresh_tokens[refresh_token]
-            logger.warning("refresh_token expired")
-            return JSONResponse({"error": "invalid_grant", "reason": "refresh_token_expired"}, status_code=400)
-
-        access_token = secrets.token_urlsafe(32)
-        access_tokens[access_token] = {
-            "user_id": refresh_data["user_id"],
-            "scope": refresh_data["scope"],
-            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=TOKEN_EXPIRY_SECONDS)
-        }
+        refresh_data = await refresh_tokens.get(refresh_token, now) if refresh_token else None
+        if refresh_data is None:
+            logger.warning("refresh_token not found or expired")
+            return _json_response({"error": "invalid_grant", "reason": "refresh_token_not_found"}, status_code=400)
+
+        access_token = create_access_token(refresh_data["user_id"], refresh_data["scope"], now)
         logger.info("refresh_token accepted; new access_token issued")
 
-        return JSONResponse({
+        return _json_response({
             "access_token": access_token,
             "token_type": "Bearer",
             "expires_in": TOKEN_EXPIRY_SECONDS,
@@ -343,8 +550,37 @@ async def token_endpoint(request: Request):
         })
 
     else:
-        logger.warning(f"unsupported grant_type {grant_type}")
-        return JSONResponse({"error": "unsupported_grant_type", "detail": grant_type}, status_code=400)
+        logger.warning("unsupported grant_type %s", grant_type)
+        return _json_response({"error": "unsupported_grant_type", "detail": grant_type}, status_code=400)
+
+
+def _request_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"Request body exceeds {_MAX_BODY_BYTES} bytes"
+    )
+
+
+def _upstream_headers(request: Request) -> Dict[str, str]:
+    """Headers for a proxied POST; rejects a declared body over the size cap up front."""
+    headers = {"Content-Type": request.headers.get("content-type", "application/json")}
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > _MAX_BODY_BYTES:
+            raise _request_too_large()
+        headers["Content-Length"] = content_length
+    # Without a Content-Length, httpx sends the streamed body chunked
+    return headers
+
+
+async def _capped_body(request: Request):
+    """Stream the request body, aborting once it exceeds the size cap."""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > _MAX_BODY_BYTES:
+            raise _request_too_large()
+        yield chunk
 
 
 @app.api_route("/sse", methods=["GET", "POST"])
@@ -360,46 +596,46 @@ async def sse_proxy(request: Request):
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    async with httpx.AsyncClient() as client:
-        try:
-            if request.method == "POST":
-                body = await request.body()
-                response = await client.post(
-                    f"{FASTMCP_SERVER_URL}/sse",
-                    content=body,
-                    headers={"Content-Type": request.headers.get("content-type", "application/json")},
-                    timeout=30.0
-                )
-                return Response(
-                    content=response.content,
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
-            
-            # GET request - SSE streaming
-            async with client.stream(
-                "GET",
-                f"{FASTMCP_SERVER_URL}/sse",
-                headers={
-                    "Accept": "text/event-stream",
-                    "Cache-Control": "no-cache"
-                },
-                timeout=None
-            ) as response:
-                return StreamingResponse(
-                    response.aiter_raw(),
-                    media_type="text/event-stream",
-                    headers={
-                        "Cache-Control": "no-cache",
-                        "Connection": "keep-alive",
-                        "X-Accel-Buffering": "no"
-                    }
-                )
-        except httpx.RequestError as e:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Failed to connect to MCP server: {str(e)}"
+    client = request.app.state.http
+    try:
+        if request.method == "POST":
+            response = await client.post(
+                "/sse",
+                content=_capped_body(request),
+                headers=_upstream_headers(request)
+            )
+            return Response(
+                content=response.content,
+                status_code=response.status_code,
+                headers={k: v for k, v in response.headers.items() if k.lower() in _FORWARD_HEADERS}
             )
+        
+        # GET request - SSE streaming; the upstream response is closed once the client stream ends
+        upstream_request = client.build_request(
+            "GET",
+            "/sse",
+            headers={
+                "Accept": "text/event-stream",
+                "Cache-Control": "no-cache"
+            },
+            timeout=_SSE_TIMEOUT
+        )
+        response = await client.send(upstream_request, stream=True)
+        return StreamingResponse(
+            response.aiter_raw(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no"
+            },
+            background=BackgroundTask(response.aclose)
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to connect to MCP server: {str(e)}"
+        )
 
 
 @app.post("/messages")
@@ -415,26 +651,23 @@ async def messages_proxy(request: Request):
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    body = await request.body()
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{FASTMCP_SERVER_URL}/messages",
-                content=body,
-                headers={"Content-Type": request.headers.get("content-type", "application/json")},
-                timeout=30.0
-            )
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=dict(response.headers)
-            )
-        except httpx.RequestError as e:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Failed to connect to MCP server: {str(e)}"
-            )
+    client = request.app.state.http
+    try:
+        response = await client.post(
+            "/messages",
+            content=_capped_body(request),
+            headers=_upstream_headers(request)
+        )
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={k: v for k, v in response.headers.items() if k.lower() in _FORWARD_HEADERS}
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to connect to MCP server: {str(e)}"
+        )
 
 
 @app.get("/health")
@@ -445,15 +678,15 @@ async def health_check():
         "gateway": "ticktick-mcp-oauth-authz",
         "auth_type": "authorization_code",
         "token_expiry_seconds": TOKEN_EXPIRY_SECONDS,
-        "active_tokens": len(access_tokens)
+        "token_store": "redis" if REDIS_URL else "memory",
+        "active_refresh_tokens": await refresh_tokens.count()
     }
 
 
-@app.get("/.well-known/mcp.json")
-async def mcp_metadata(request: Request):
-    """MCP server metadata endpoint."""
-    origin = _get_request_origin(request)
-    return {
+@lru_cache(maxsize=8)
+def _build_mcp_metadata(origin: str) -> bytes:
+    """Serialized MCP server metadata for origin."""
+    return orjson.dumps({
         "name": "TickTick MCP Server",
         "version": "2.0.0",
         "authentication": {
@@ -468,14 +701,13 @@ async def mcp_metadata(request: Request):
             "sse": f"{origin}/sse",
             "messages": f"{origin}/messages"
         }
-    }
+    })
 
 
-@app.get("/.well-known/oauth-authorization-server")
-async def oauth_authorization_server_metadata(request: Request):
-    """OAuth 2.0 Authorization Server Metadata (RFC 8414)."""
-    origin = _get_request_origin(request)
-    return {
+@lru_cache(maxsize=8)
+def _build_oauth_authorization_server_metadata(origin: str) -> bytes:
+    """Serialized RFC 8414 authorization server metadata for origin."""
+    return orjson.dumps({
         "issuer": origin,
         "authorization_endpoint": f"{origin}/authorize",
         "token_endpoint": f"{origin}/oauth/token",
@@ -484,15 +716,14 @@ async def oauth_authorization_server_metadata(request: Request):
         "code_challenge_methods_supported": ["S256"],
         "scopes_supported": ["mcp:full", "claudeai"],
         "token_endpoint_auth_methods_supported": ["none"],
-    }
+    })
 
 
-@app.get("/.well-known/oauth-protected-resource")
-async def oauth_protected_resource_metadata(request: Request):
-    """Basic protected resource metadata for Claude discovery."""
-    origin = _get_request_origin(request)
+@lru_cache(maxsize=8)
+def _build_oauth_protected_resource_metadata(origin: str) -> bytes:
+    """Serialized protected resource metadata for origin."""
     auth_metadata = f"{origin}/.well-known/oauth-authorization-server"
-    return {
+    return orjson.dumps({
         "issuer": origin,
         "resource": "ticktick-mcp",
         "authorization_servers": [auth_metadata],
@@ -500,7 +731,31 @@ async def oauth_protected_resource_metadata(request: Request):
             "sse": f"{origin}/sse",
             "messages": f"{origin}/messages"
         }
-    }
+    })
+
+
+@app.get("/.well-known/mcp.json")
+async def mcp_metadata(request: Request):
+    """MCP server metadata endpoint."""
+    return Response(content=_build_mcp_metadata(_get_request_origin(request)), media_type="application/json")
+
+
+@app.get("/.well-known/oauth-authorization-server")
+async def oauth_authorization_server_metadata(request: Request):
+    """OAuth 2.0 Authorization Server Metadata (RFC 8414)."""
+    return Response(
+        content=_build_oauth_authorization_server_metadata(_get_request_origin(request)),
+        media_type="application/json"
+    )
+
+
+@app.get("/.well-known/oauth-protected-resource")
+async def oauth_protected_resource_metadata(request: Request):
+    """Basic protected resource metadata for Claude discovery."""
+    return Response(
+        content=_build_oauth_protected_resource_metadata(_get_request_origin(request)),
+        media_type="application/json"
+    )
 
 
 if __name__ == "__main__":
@@ -511,4 +766,24 @@ if __name__ == "__main__":
     print(f"FastMCP server URL: {FASTMCP_SERVER_URL}")
     print(f"Claude callback URL: {CLAUDE_CALLBACK_URL}")
     
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    workers = int(os.getenv("MCP_OAUTH_WORKERS", "1"))
+    if workers > 1:
+        # Every worker must share the token stores and sign with the same key,
+        # otherwise codes and JWTs issued by one worker are rejected by the others.
+        missing = [name for name, value in (("MCP_OAUTH_REDIS_URL", REDIS_URL), ("MCP_OAUTH_SIGNING_KEY", SIGNING_KEY_B64)) if not value]
+        if missing:
+            print(f"ERROR: MCP_OAUTH_WORKERS={workers} requires {' and '.join(missing)} to be set.")
+            print("Set them, or run a single worker with MCP_OAUTH_WORKERS=1.")
+            exit(1)
+    print(f"Workers: {workers}")
+    
+    uvicorn.run(
+        # Workers re-import the app from its module; a single worker reuses this one
+        "ticktick_mcp.oauth_authorization_gateway:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8080,
+        loop="auto",
+        http="httptools",
+        workers=workers,
+        log_level=LOG_LEVEL_NO
+    )